@@ -0,0 +1,16 @@
+# -*- coding: utf-8 -*-
+
+"""
+httpbin.asgi
+~~~~~~~~~~~~
+
+This module exposes httpbin as an ASGI application, e.g.:
+
+    $ uvicorn httpbin.asgi:app --loop uvloop --http httptools
+"""
+
+from asgiref.wsgi import WsgiToAsgi
+
+from .core import app as wsgi_app
+
+app = WsgiToAsgi(wsgi_app)
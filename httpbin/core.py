@@ -8,28 +8,28 @@ This module provides the core HttpBin experience.
 """
 
 import base64
+import functools
 import json
+import math
 import os
 import random
 import time
 import uuid
-import argparse
 
+import jinja2
+import orjson
 from flask import (
     Flask,
     Response,
     request,
-    render_template,
+    render_template as flask_render_template,
     redirect,
     jsonify as flask_jsonify,
     make_response,
     url_for,
     abort,
 )
-from six.moves import range as xrange
-from werkzeug.datastructures import WWWAuthenticate, MultiDict
 from werkzeug.http import http_date
-from werkzeug.wrappers import BaseResponse
 from werkzeug.http import parse_authorization_header
 from flasgger import Swagger, NO_SANITIZER
 
@@ -38,11 +38,11 @@ from .helpers import (
     get_headers,
     status_code,
     get_dict,
+    dict_getter,
     get_request_range,
     check_basic_auth,
     check_digest_auth,
     secure_cookie,
-    H,
     ROBOT_TXT,
     ANGRY_ASCII,
     parse_multi_value_header,
@@ -69,25 +69,110 @@ ENV_COOKIES = (
 )
 
 
+class HttpbinResponse(Response):
+    """Response class for every httpbin view."""
+
+    # Prevent WSGI from correcting the casing of the Location header
+    autocorrect_location_header = False
+
+
+# Every JSON body is pretty-printed with sorted keys and a trailing newline.
+# Unlike Flask's jsonify(), lines carry no trailing space after the item
+# separator and non-ASCII text is written as UTF-8 rather than \u-escaped,
+# so bodies (and their Content-Length) differ byte-for-byte from Flask's.
+_ORJSON_OPTS = orjson.OPT_INDENT_2 | orjson.OPT_SORT_KEYS | orjson.OPT_APPEND_NEWLINE
+
+
+class JSONResponse(HttpbinResponse):
+    """Response class for the bodies built by jsonify()."""
+
+    default_mimetype = "application/json"
+
+
 def jsonify(*args, **kwargs):
-    response = flask_jsonify(*args, **kwargs)
-    if not response.data.endswith(b"\n"):
-        response.data += b"\n"
-    return response
+    if args and kwargs:
+        raise TypeError("jsonify() behavior undefined when passed both args and kwargs")
+    elif len(args) == 1:
+        data = args[0]
+    else:
+        data = args or kwargs
+
+    # orjson hands back UTF-8 bytes, trailing newline included, so the body
+    # is built once and handed to the Response as-is. It rejects integers
+    # beyond 64 bits and lone surrogates, and writes NaN and Infinity as
+    # null, so those bodies go through the json module instead.
+    try:
+        body = orjson.dumps(data, option=_ORJSON_OPTS)
+    except orjson.JSONEncodeError:
+        body = None
+    if body is None or (b"null" in body and _has_non_finite(data)):
+        body = json.dumps(data, indent=2, sort_keys=True) + "\n"
+    return JSONResponse(body)
 
 
-# Prevent WSGI from correcting the casing of the Location header
-BaseResponse.autocorrect_location_header = False
+def _has_non_finite(value):
+    if isinstance(value, float):
+        return not math.isfinite(value)
+    if isinstance(value, dict):
+        return any(_has_non_finite(v) for v in value.values())
+    if isinstance(value, (list, tuple)):
+        return any(_has_non_finite(v) for v in value)
+    return False
+
 
 # Find the correct template folder when running from a different location
 tmpl_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "templates")
 
-app = Flask(__name__, template_folder=tmpl_dir)
+
+# Responses returned as other Response types are coerced to response_class
+# by Flask.
+class HttpbinFlask(Flask):
+    response_class = HttpbinResponse
+
+
+app = HttpbinFlask(__name__, template_folder=tmpl_dir)
 app.debug = bool(os.environ.get("DEBUG"))
 app.config["JSONIFY_PRETTYPRINT_REGULAR"] = True
 
+# Templates compiled ahead of time by compile_templates() are imported as
+# Python modules, skipping Jinja's lexer and parser. Anything missing from
+# the archive still goes through Flask's regular loader. The archive is not
+# checked against templates/, so it is only used when explicitly enabled
+# with HTTPBIN_COMPILED_TEMPLATES (as the Docker image does).
+compiled_tmpl_path = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "compiled_templates.zip"
+)
+
+if "HTTPBIN_COMPILED_TEMPLATES" in os.environ and os.path.exists(compiled_tmpl_path):
+    app.jinja_env.loader = jinja2.ChoiceLoader(
+        [jinja2.ModuleLoader(compiled_tmpl_path), app.jinja_env.loader]
+    )
+
+
+def compile_templates(target=compiled_tmpl_path):
+    """Compiles the templates into a zip archive loadable by ModuleLoader."""
+    env = app.jinja_env.overlay(loader=app.create_global_jinja_loader())
+    env.compile_templates(target, extensions=("html", "xml", "txt"), zip="deflated")
+
+
 app.add_template_global("HTTPBIN_TRACKING" in os.environ, name="tracking_enabled")
 
+
+@functools.lru_cache(maxsize=None)
+def _get_template(template_name):
+    return app.jinja_env.get_template(template_name)
+
+
+def render_template(template_name, **context):
+    # In production the templates ship with the package and never change, so
+    # resolve each one once and hand Flask the compiled Template directly
+    # instead of going through the loader on every request. With DEBUG or
+    # TEMPLATES_AUTO_RELOAD, go through Flask so edits are picked up.
+    if app.templates_auto_reload:
+        return flask_render_template(template_name, **context)
+    return flask_render_template(_get_template(template_name), **context)
+
+
 app.config["SWAGGER"] = {"title": "httpbin.org", "uiversion": 3}
 
 template = {
@@ -181,6 +266,20 @@ if os.environ.get("BUGSNAG_API_KEY") is not None:
     except:
         app.logger.warning("Unable to initialize Bugsnag exception handling.")
 
+# Set up Sentry exception tracking, if desired. To use Sentry, install the
+# Sentry SDK with the command "pip install sentry-sdk[flask]", and set the
+# environment variable SENTRY_DSN.
+if os.environ.get("SENTRY_DSN") is not None:
+    try:
+        import sentry_sdk
+        from sentry_sdk.integrations.flask import FlaskIntegration
+
+        sentry_sdk.init(
+            dsn=os.environ.get("SENTRY_DSN"), integrations=[FlaskIntegration()]
+        )
+    except:
+        app.logger.warning("Unable to initialize Sentry exception handling.")
+
 # -----------
 # Middlewares
 # -----------
@@ -213,22 +312,27 @@ def before_request():
             abort(501, "Chunked requests are not supported for server %s" % server)
 
 
+# Both of these headers are only used for the "preflight request"
+# http://www.w3.org/TR/cors/#access-control-allow-methods-response-header
+CORS_PREFLIGHT_HEADERS = (
+    ("Access-Control-Allow-Methods", "GET, POST, PUT, DELETE, PATCH, OPTIONS"),
+    ("Access-Control-Max-Age", "3600"),  # 1 hour cache
+)
+
+
 @app.after_request
 def set_cors_headers(response):
-    response.headers["Access-Control-Allow-Origin"] = request.headers.get("Origin", "*")
+    response.headers["Access-Control-Allow-Origin"] = request.environ.get(
+        "HTTP_ORIGIN", "*"
+    )
     response.headers["Access-Control-Allow-Credentials"] = "true"
 
     if request.method == "OPTIONS":
-        # Both of these headers are only used for the "preflight request"
-        # http://www.w3.org/TR/cors/#access-control-allow-methods-response-header
-        response.headers[
-            "Access-Control-Allow-Methods"
-        ] = "GET, POST, PUT, DELETE, PATCH, OPTIONS"
-        response.headers["Access-Control-Max-Age"] = "3600"  # 1 hour cache
-        if request.headers.get("Access-Control-Request-Headers") is not None:
-            response.headers["Access-Control-Allow-Headers"] = request.headers[
-                "Access-Control-Request-Headers"
-            ]
+        for key, value in CORS_PREFLIGHT_HEADERS:
+            response.headers[key] = value
+        allow_headers = request.environ.get("HTTP_ACCESS_CONTROL_REQUEST_HEADERS")
+        if allow_headers is not None:
+            response.headers["Access-Control-Allow-Headers"] = allow_headers
     return response
 
 
@@ -236,6 +340,15 @@ def set_cors_headers(response):
 # Routes
 # ------
 
+# Request dicts for the busiest views, with their keys resolved up front.
+_view_get_dict = dict_getter("url", "args", "headers", "origin")
+_view_anything_dict = dict_getter(
+    "url", "args", "headers", "origin", "method", "form", "data", "files", "json"
+)
+_view_method_dict = dict_getter(
+    "url", "args", "form", "data", "origin", "headers", "files", "json"
+)
+
 
 @app.route("/legacy")
 def view_landing_page():
@@ -358,9 +471,7 @@ def view_user_agent():
         description: The request's User-Agent header.
     """
 
-    headers = get_headers()
-
-    return jsonify({"user-agent": headers["user-agent"]})
+    return jsonify({"user-agent": request.environ.get("HTTP_USER_AGENT")})
 
 
 @app.route("/get", methods=("GET",))
@@ -376,7 +487,7 @@ def view_get():
         description: The request's query parameters.
     """
 
-    return jsonify(get_dict("url", "args", "headers", "origin"))
+    return jsonify(_view_get_dict())
 
 
 @app.route("/anything", methods=["GET", "POST", "PUT", "DELETE", "PATCH", "TRACE"])
@@ -396,19 +507,7 @@ def view_anything(anything=None):
         description: Anything passed in request
     """
 
-    return jsonify(
-        get_dict(
-            "url",
-            "args",
-            "headers",
-            "origin",
-            "method",
-            "form",
-            "data",
-            "files",
-            "json",
-        )
-    )
+    return jsonify(_view_anything_dict())
 
 
 @app.route("/post", methods=("POST",))
@@ -424,9 +523,7 @@ def view_post():
         description: The request's POST parameters.
     """
 
-    return jsonify(
-        get_dict("url", "args", "form", "data", "origin", "headers", "files", "json")
-    )
+    return jsonify(_view_method_dict())
 
 
 @app.route("/put", methods=("PUT",))
@@ -442,9 +539,7 @@ def view_put():
         description: The request's PUT parameters.
     """
 
-    return jsonify(
-        get_dict("url", "args", "form", "data", "origin", "headers", "files", "json")
-    )
+    return jsonify(_view_method_dict())
 
 
 @app.route("/patch", methods=("PATCH",))
@@ -460,9 +555,7 @@ def view_patch():
         description: The request's PATCH parameters.
     """
 
-    return jsonify(
-        get_dict("url", "args", "form", "data", "origin", "headers", "files", "json")
-    )
+    return jsonify(_view_method_dict())
 
 
 @app.route("/delete", methods=("DELETE",))
@@ -478,9 +571,7 @@ def view_delete():
         description: The request's DELETE parameters.
     """
 
-    return jsonify(
-        get_dict("url", "args", "form", "data", "origin", "headers", "files", "json")
-    )
+    return jsonify(_view_method_dict())
 
 
 @app.route("/gzip")
@@ -801,23 +892,47 @@ def response_headers():
     """
     # Pending swaggerUI update
     # https://github.com/swagger-api/swagger-ui/issues/3850
-    headers = MultiDict(request.args.items(multi=True))
-    response = jsonify(list(headers.lists()))
-
-    while True:
-        original_data = response.data
+    response = jsonify()
+    for key, value in request.args.items(multi=True):
+        response.headers.add(key, value)
+
+    # Group the values case-insensitively, the way Headers.get_all() does,
+    # in a single pass over the response headers.
+    values = {}
+    for key, value in response.headers.items():
+        values.setdefault(key.lower(), []).append(value)
+    keys = list(response.headers.keys())
+
+    def build_response():
         d = {}
-        for key in response.headers.keys():
-            value = response.headers.get_all(key)
+        for key in keys:
+            value = values[key.lower()]
             if len(value) == 1:
                 value = value[0]
             d[key] = value
-        response = jsonify(d)
-        for key, value in headers.items(multi=True):
-            response.headers.add(key, value)
-        response_has_changed = response.data != original_data
-        if not response_has_changed:
+        return jsonify(d)
+
+    # The body echoes the response headers, including its own
+    # Content-Length, which is spelled out once per key sharing its values.
+    # Only those digits change between serializations, so measure the body
+    # once and solve for the length that accounts for its own digits.
+    content_length = values["content-length"]
+    spellings = len(set(key for key in keys if values[key.lower()] is content_length))
+    base = build_response().content_length - spellings * len(content_length[0])
+    # The digit count only grows, so this settles within a couple of steps;
+    # the cap keeps crafted queries from ever looping, and the last length
+    # is used as-is if it somehow doesn't.
+    length = base + spellings * len(str(base))
+    for _ in range(3):
+        if length == base + spellings * len(str(length)):
             break
+        length = base + spellings * len(str(length))
+
+    content_length[0] = str(length)
+    response = build_response()
+
+    for key, value in request.args.items(multi=True):
+        response.headers.add(key, value)
     return response
 
 
@@ -1270,7 +1385,7 @@ def drip():
     pause = duration / numbytes
 
     def generate_bytes():
-        for i in xrange(numbytes):
+        for i in range(numbytes):
             yield b"*"
             time.sleep(pause)
 
@@ -1287,6 +1402,12 @@ def drip():
     return response
 
 
+@functools.lru_cache(maxsize=1024)
+def _decode_base64(value):
+    encoded = value.encode("utf-8")  # base64 expects binary string as input
+    return base64.urlsafe_b64decode(encoded).decode("utf-8")
+
+
 @app.route("/base64/<value>")
 def decode_base64(value):
     """Decodes base64url-encoded string.
@@ -1304,9 +1425,8 @@ def decode_base64(value):
       200:
         description: Decoded base64 content.
     """
-    encoded = value.encode("utf-8")  # base64 expects binary string as input
     try:
-        return base64.urlsafe_b64decode(encoded).decode("utf-8")
+        return _decode_base64(value)
     except:
         return "Incorrect Base64 data try: SFRUUEJJTiBpcyBhd2Vzb21l"
 
@@ -1480,7 +1600,7 @@ def stream_random_bytes(n):
     def generate_bytes():
         chunks = bytearray()
 
-        for i in xrange(n):
+        for i in range(n):
             chunks.append(random.randint(0, 255))
             if len(chunks) == chunk_size:
                 yield (bytes(chunks))
@@ -1534,8 +1654,8 @@ def range_request(numbytes):
 
     if (
         first_byte_pos > last_byte_pos
-        or first_byte_pos not in xrange(0, numbytes)
-        or last_byte_pos not in xrange(0, numbytes)
+        or first_byte_pos not in range(0, numbytes)
+        or last_byte_pos not in range(0, numbytes)
     ):
         response = Response(
             headers={
@@ -1551,7 +1671,7 @@ def range_request(numbytes):
     def generate_bytes():
         chunks = bytearray()
 
-        for i in xrange(first_byte_pos, last_byte_pos + 1):
+        for i in range(first_byte_pos, last_byte_pos + 1):
 
             # We don't want the resource to change across requests, so we need
             # to use a predictable data generation function
@@ -1608,7 +1728,7 @@ def link_page(n, offset):
     link = "<a href='{0}'>{1}</a> "
 
     html = ["<html><head><title>Links</title></head><body>"]
-    for i in xrange(n):
+    for i in range(n):
         if i == offset:
             html.append("{0} ".format(i))
         else:
@@ -1778,7 +1898,14 @@ def a_json_endpoint():
     )
 
 
+# All routes are registered by now; sort the rule table up front so the
+# first request doesn't pay for it inside Map.match().
+app.url_map.update()
+
+
 if __name__ == "__main__":
+    import argparse
+
     parser = argparse.ArgumentParser()
     parser.add_argument("--port", type=int, default=5000)
     parser.add_argument("--host", default="127.0.0.1")
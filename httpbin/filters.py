@@ -7,12 +7,13 @@ httpbin.filters
 This module provides response filter decorators.
 """
 
+import functools
 import gzip as gzip2
 import zlib
+from io import BytesIO
 
 import brotli as _brotli
 
-from six import BytesIO
 from decimal import Decimal
 from time import time as now
 
@@ -35,6 +36,27 @@ def x_runtime(f, *args, **kwargs):
     return r
 
 
+# The compressed payload only depends on the uncompressed one, so identical
+# responses (same echoed origin and headers) reuse the earlier result.
+@functools.lru_cache(maxsize=256)
+def _gzip_compress(content):
+    gzip_buffer = BytesIO()
+    gzip_file = gzip2.GzipFile(
+        mode='wb',
+        compresslevel=4,
+        fileobj=gzip_buffer
+    )
+    gzip_file.write(content)
+    gzip_file.close()
+
+    return gzip_buffer.getvalue()
+
+
+@functools.lru_cache(maxsize=256)
+def _brotli_compress(content):
+    return _brotli.compress(content)
+
+
 @decorator
 def gzip(f, *args, **kwargs):
     """GZip Flask Response Decorator."""
@@ -46,16 +68,7 @@ def gzip(f, *args, **kwargs):
     else:
         content = data
 
-    gzip_buffer = BytesIO()
-    gzip_file = gzip2.GzipFile(
-        mode='wb',
-        compresslevel=4,
-        fileobj=gzip_buffer
-    )
-    gzip_file.write(content)
-    gzip_file.close()
-
-    gzip_data = gzip_buffer.getvalue()
+    gzip_data = _gzip_compress(content)
 
     if isinstance(data, Response):
         data.data = gzip_data
@@ -103,7 +116,7 @@ def brotli(f, *args, **kwargs):
     else:
         content = data
 
-    deflated_data = _brotli.compress(content)
+    deflated_data = _brotli_compress(content)
 
     if isinstance(data, Response):
         data.data = deflated_data
@@ -13,11 +13,11 @@ import re
 import time
 import os
 from hashlib import md5, sha256, sha512
+from urllib.parse import urlparse, urlunparse
 from werkzeug.http import parse_authorization_header
 from werkzeug.datastructures import WWWAuthenticate
 
 from flask import request, make_response
-from six.moves.urllib.parse import urlparse, urlunparse
 
 
 from .structures import CaseInsensitiveDict
@@ -168,42 +168,60 @@ def get_url(request):
     return urlunparse(url)
 
 
-def get_dict(*keys, **extras):
-    """Returns request dict of given keys."""
-
-    _keys = ('url', 'args', 'form', 'data', 'origin', 'headers', 'files', 'json', 'method')
-
-    assert all(map(_keys.__contains__, keys))
-    data = request.data
-    form = semiflatten(request.form)
+def get_json():
+    """Returns the request body decoded as JSON, or None."""
 
     try:
-        _json = json.loads(data.decode('utf-8'))
+        return json.loads(request.data.decode('utf-8'))
     except (ValueError, TypeError):
-        _json = None
-
-    d = dict(
-        url=get_url(request),
-        args=semiflatten(request.args),
-        form=form,
-        data=json_safe(data),
-        origin=request.headers.get('X-Forwarded-For', request.remote_addr),
-        headers=get_headers(),
-        files=get_files(),
-        json=_json,
-        method=request.method,
-    )
+        return None
+
+
+# Only the requested keys are computed, so e.g. /get never parses the body.
+DICT_GETTERS = {
+    'url': lambda: get_url(request),
+    'args': lambda: semiflatten(request.args),
+    'form': lambda: semiflatten(request.form),
+    'data': lambda: json_safe(request.data),
+    'origin': lambda: request.headers.get('X-Forwarded-For', request.remote_addr),
+    'headers': get_headers,
+    'files': get_files,
+    'json': get_json,
+    'method': lambda: request.method,
+}
+
+
+def get_dict(*keys, **extras):
+    """Returns request dict of given keys."""
+
+    assert all(map(DICT_GETTERS.__contains__, keys))
 
     out_d = dict()
 
     for key in keys:
-        out_d[key] = d.get(key)
+        out_d[key] = DICT_GETTERS[key]()
 
     out_d.update(extras)
 
     return out_d
 
 
+def dict_getter(*keys):
+    """Returns a function building the request dict of given keys.
+
+    The keys are checked and resolved to their getters once, up front, for
+    views that always ask for the same keys.
+    """
+
+    assert all(map(DICT_GETTERS.__contains__, keys))
+    getters = tuple((key, DICT_GETTERS[key]) for key in keys)
+
+    def get_dict():
+        return {key: getter() for key, getter in getters}
+
+    return get_dict
+
+
 def status_code(code):
     """Returns response object of given status code."""
 
@@ -28,14 +28,15 @@ setup(
          'Natural Language :: English',
          'License :: OSI Approved :: MIT License',
          'Programming Language :: Python',
-         'Programming Language :: Python :: 2.7',
          'Programming Language :: Python :: 3.6',
     ],
-    test_suite="test_httpbin",
     packages=find_packages(),
     include_package_data = True, # include files listed in MANIFEST.in
     install_requires=[
-        'Flask', 'MarkupSafe', 'decorator', 'itsdangerous', 'six', 'brotlipy',
-        'raven[flask]', 'werkzeug>=0.14.1', 'gevent', 'flasgger'
+        'Flask', 'MarkupSafe', 'decorator', 'itsdangerous', 'brotlipy',
+        'werkzeug>=0.14.1', 'gevent', 'flasgger', 'orjson'
     ],
+    extras_require={
+        'asgi': ['asgiref', 'uvicorn', 'uvloop', 'httptools'],
+    },
 )
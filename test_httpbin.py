@@ -2,13 +2,15 @@
 # -*- coding: utf-8 -*-
 import os
 import base64
+import functools
+import random
+import sys
 import unittest
 import contextlib
-import six
 import json
+import pytest
 from werkzeug.http import parse_dict_header
 from hashlib import md5, sha256, sha512
-from six import BytesIO
 
 import httpbin
 from httpbin.helpers import parse_multi_value_header
@@ -34,21 +36,45 @@ def _setenv(key, value):
 
 def _string_to_base64(string):
     """Encodes string to utf-8 and then base64"""
-    utf8_encoded = string.encode('utf-8')
-    return base64.urlsafe_b64encode(utf8_encoded)
+    try:
+        # ASCII is a subset of utf-8 and skips the full encoder
+        encoded = string.encode('ascii')
+    except UnicodeEncodeError:
+        encoded = string.encode('utf-8')
+    return base64.urlsafe_b64encode(encoded)
+
+# httpbin's digest auth implementation uses the remote addr to build the
+# nonce; the test client copies environ_base, so one dict can be shared
+_LOCAL_ENVIRON = {'REMOTE_ADDR': '127.0.0.1'}
+
+# /range/<n> serves the lowercase alphabet, repeated
+_ASCII_LOWERCASE = b'abcdefghijklmnopqrstuvwxyz'
+
+_STATUS_METHODS = ('GET', 'HEAD', 'POST', 'PUT', 'DELETE', 'PATCH', 'TRACE')
+
+# zero-padded nonce counts, as sent in the digest nc field
+_NC_STRS = tuple(f'{i:08}' for i in range(32))
+
+# /bytes/10?seed=0 and /stream-bytes/10?seed=0 output, as produced by
+# Python 3's random module; seeding makes it stable across runs
+_BYTES_SEED0 = b'\xc5\xd7\x14\x84\xf8\xcf\x9b\xf4\xb7o'
+
+_HASHERS = {'SHA-256': sha256, 'SHA-512': sha512}
 
 def _hash(data, algorithm):
     """Encode binary data according to specified algorithm, use MD5 by default"""
-    if algorithm == 'SHA-256':
-        return sha256(data).hexdigest()
-    elif algorithm == 'SHA-512':
-        return sha512(data).hexdigest()
-    else:
-        return md5(data).hexdigest()
+    return _HASHERS.get(algorithm, md5)(data).hexdigest()
+
+def _digest_ha1(username, realm, password, algorithm):
+    """Compute the digest HA1 hash of the user's credentials"""
+    a1 = b':'.join([username.encode('utf-8'), (realm or '').encode('utf-8'),
+                    password.encode('utf-8')])
+    return _hash(a1, algorithm)
 
 def _make_digest_auth_header(username, password, method, uri, nonce,
                              realm=None, opaque=None, algorithm=None,
-                             qop=None, cnonce=None, nc=None, body=None):
+                             qop=None, cnonce=None, nc=None, body=None,
+                             ha1=None):
     """Compile a digest authentication header string.
 
     Arguments:
@@ -60,6 +86,7 @@ def _make_digest_auth_header(username, password, method, uri, nonce,
     - `cnonce`: client nonce, required if qop is "auth" or "auth-int"
     - `nc`: client nonce count, required if qop is "auth" or "auth-int"
     - `body`: body of the outgoing request (bytes), used if qop is "auth-int"
+    - `ha1`: precomputed HA1, reused across requests for the same credentials
     """
 
     assert username
@@ -69,60 +96,65 @@ def _make_digest_auth_header(username, password, method, uri, nonce,
     assert uri
     assert algorithm in ('MD5', 'SHA-256', 'SHA-512', None)
 
-    a1 = ':'.join([username, realm or '', password])
-    ha1 = _hash(a1.encode('utf-8'), algorithm)
+    if ha1 is None:
+        ha1 = _digest_ha1(username, realm, password, algorithm)
 
-    a2 = ':'.join([method, uri])
+    a2 = [method.encode('utf-8'), uri.encode('utf-8')]
     if qop == 'auth-int':
-        a2 = ':'.join([a2, _hash(body or b'', algorithm)])
-    ha2 = _hash(a2.encode('utf-8'), algorithm)
+        a2.append(_hash(body or b'', algorithm).encode('ascii'))
+    ha2 = _hash(b':'.join(a2), algorithm)
 
-    a3 = ':'.join([ha1, nonce])
+    a3 = [ha1, nonce]
     if qop in ('auth', 'auth-int'):
         assert cnonce
         assert nc
-        a3 = ':'.join([a3, nc, cnonce, qop])
+        a3 += [nc, cnonce, qop]
 
-    a3 = ':'.join([a3, ha2])
-    auth_response = _hash(a3.encode('utf-8'), algorithm)
+    a3.append(ha2)
+    auth_response = _hash(':'.join(a3).encode('utf-8'), algorithm)
 
-    auth_header = \
-        'Digest username="{0}", response="{1}", uri="{2}", nonce="{3}"'\
-            .format(username, auth_response, uri, nonce)
+    parts = [
+        f'Digest username="{username}"',
+        f'response="{auth_response}"',
+        f'uri="{uri}"',
+        f'nonce="{nonce}"',
+    ]
 
     # 'realm' and 'opaque' should be returned unchanged, even if empty
-    if realm != None:
-        auth_header += ', realm="{0}"'.format(realm)
-    if opaque != None:
-        auth_header += ', opaque="{0}"'.format(opaque)
+    if realm is not None:
+        parts.append(f'realm="{realm}"')
+    if opaque is not None:
+        parts.append(f'opaque="{opaque}"')
 
     if algorithm:
-        auth_header += ', algorithm="{0}"'.format(algorithm)
+        parts.append(f'algorithm="{algorithm}"')
     if cnonce:
-        auth_header += ', cnonce="{0}"'.format(cnonce)
+        parts.append(f'cnonce="{cnonce}"')
     if nc:
-        auth_header += ', nc={0}'.format(nc)
+        parts.append(f'nc={nc}')
     if qop:
-        auth_header += ', qop={0}'.format(qop)
+        parts.append(f'qop={qop}')
 
-    return auth_header
+    return ', '.join(parts)
 
 class HttpbinTestCase(unittest.TestCase):
     """Httpbin tests"""
 
-    def setUp(self):
+    @classmethod
+    def setUpClass(cls):
         httpbin.app.debug = True
-        self.app = httpbin.app.test_client()
+        cls.app = httpbin.app.test_client()
+
+    def setUp(self):
+        # the client is shared, so don't let cookies leak between tests
+        self.app.cookie_jar.clear()
 
     def test_index(self):   
         response = self.app.get('/', headers={'User-Agent': 'test'})
         self.assertEqual(response.status_code, 200)
  
     def get_data(self, response):
-        if 'get_data' in dir(response):
-            return response.get_data()
-        else:
-            return response.data
+        return response.get_data()
 
     def test_response_headers_simple(self):
         supported_verbs = ['get', 'post']
@@ -142,6 +174,39 @@ class HttpbinTestCase(unittest.TestCase):
             self.assertEqual(response.headers.get_all('animal'), ['dog', 'cat'])
             assert json.loads(response.data.decode('utf-8'))['animal'] == ['dog', 'cat']
 
+    def _response_headers_content_length(self, query):
+        response = self.app.get('/response-headers?' + query)
+        self.assertEqual(response.status_code, 200)
+        data = self.get_data(response)
+        body = json.loads(data.decode('utf-8'))
+        # the body's own Content-Length comes first, under every spelling
+        header_length = response.headers.get_all('Content-Length')[0]
+        for key in ('Content-Length', 'content-length'):
+            if key in body:
+                value = body[key]
+                self.assertEqual(value if isinstance(value, str) else value[0], header_length)
+        self.assertEqual(header_length, str(len(data)))
+        return len(data)
+
+    def test_response_headers_content_length(self):
+        for query in ('', 'Content-Length=5', 'content-length=5&Content-Length=77'):
+            with self.subTest(query=query):
+                self._response_headers_content_length(query)
+
+    def test_response_headers_content_length_digit_boundaries(self):
+        # padding the body one byte at a time walks its length across each
+        # point where the Content-Length it echoes gains a digit
+        unpadded = self._response_headers_content_length('pad=')
+        for boundary in (100, 1000, 10000):
+            start = boundary - unpadded - 3
+            lengths = [
+                self._response_headers_content_length('pad=' + 'x' * n)
+                for n in range(start, start + 6)
+            ]
+            with self.subTest(boundary=boundary):
+                self.assertLess(min(lengths), boundary)
+                self.assertGreaterEqual(max(lengths), boundary)
+
     def test_get(self):
         response = self.app.get('/get', headers={'User-Agent': 'test'})
         self.assertEqual(response.status_code, 200)
@@ -195,6 +260,21 @@ class HttpbinTestCase(unittest.TestCase):
         response = self.app.post('/post', data=u'оживлённым'.encode('utf-8'))
         self.assertEqual(json.loads(response.data.decode('utf-8'))['data'], u'оживлённым')
 
+    def test_post_json_outside_orjson_range(self):
+        # big integers and lone surrogates are valid JSON that orjson
+        # can't encode, so they have to be echoed some other way
+        for body in ('[1, 18446744073709551616]', '{"a": "\\ud800"}'):
+            with self.subTest(body=body):
+                response = self.app.post('/post', data=body, content_type='application/json')
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(json.loads(response.data.decode('utf-8'))['json'], json.loads(body))
+
+    def test_post_json_non_finite_floats(self):
+        response = self.app.post('/post', data='[NaN, 1e400]', content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'NaN', response.data)
+        self.assertIn(b'Infinity', response.data)
+
     def test_post_file_with_missing_content_type_header(self):
         # I built up the form data manually here because I couldn't find a way
         # to convince the werkzeug test client to send files without the
@@ -343,11 +423,7 @@ class HttpbinTestCase(unittest.TestCase):
         auth_header = 'Digest username="user",realm="wrong",nonce="wrong",uri="/digest-auth/user/passwd/MD5",response="wrong",opaque="wrong"'
         response = self.app.get(
             '/digest-auth/auth/user/passwd/MD5',
-            environ_base={
-                # httpbin's digest auth implementation uses the remote addr to
-                # build the nonce
-                'REMOTE_ADDR': '127.0.0.1',
-            },
+            environ_base=_LOCAL_ENVIRON,
             headers={
                 'Authorization': auth_header,
             }
@@ -355,16 +431,6 @@ class HttpbinTestCase(unittest.TestCase):
         self.assertTrue('Digest' in response.headers.get('WWW-Authenticate'))
         self.assertEqual(response.status_code, 401)
 
-    def test_digest_auth(self):
-        """Test different combinations of digest auth parameters"""
-        username = 'user'
-        password = 'passwd'
-        for qop in None, 'auth', 'auth-int',:
-            for algorithm in None, 'MD5', 'SHA-256', 'SHA-512':
-                for body in None, b'', b'request payload':
-                    for stale_after in (None, 1, 4) if algorithm else (None,) :
-                        self._test_digest_auth(username, password, qop, algorithm, body, stale_after)
-
     def test_digest_auth_with_wrong_authorization_type(self):
         """Sending an non-digest Authorization header to /digest-auth should return a 401"""
         auth_headers = (
@@ -379,111 +445,6 @@ class HttpbinTestCase(unittest.TestCase):
             )
             self.assertEqual(response.status_code, 401)
 
-    def _test_digest_auth(self, username, password, qop, algorithm=None, body=None, stale_after=None):
-        uri = self._digest_auth_create_uri(username, password, qop, algorithm, stale_after)
-
-        unauthorized_response = self._test_digest_auth_first_challenge(uri)
-
-        header = unauthorized_response.headers.get('WWW-Authenticate')
-
-        authorized_response, nonce = self._test_digest_response_for_auth_request(header, username, password, qop, uri, body)
-        self.assertEqual(authorized_response.status_code, 200)
-
-        if None == stale_after :
-            return
-
-        # test stale after scenerio
-        self._digest_auth_stale_after_check(header, username, password, uri, body, qop, stale_after)
-
-    def _test_digest_auth_first_challenge(self, uri):
-        unauthorized_response = self.app.get(
-            uri,
-            environ_base={
-                # digest auth uses the remote addr to build the nonce
-                'REMOTE_ADDR': '127.0.0.1',
-            }
-        )
-        # make sure it returns a 401
-        self.assertEqual(unauthorized_response.status_code, 401)
-        return unauthorized_response
-
-    def _digest_auth_create_uri(self, username, password, qop, algorithm, stale_after):
-        uri = '/digest-auth/{0}/{1}/{2}'.format(qop or 'wrong-qop', username, password)
-        if algorithm:
-            uri += '/' + algorithm
-        if stale_after:
-            uri += '/{0}'.format(stale_after)
-        return uri
-
-    def _digest_auth_stale_after_check(self, header, username, password, uri, body, qop, stale_after):
-        for nc in range(2, stale_after + 1):
-            authorized_response, nonce = self._test_digest_response_for_auth_request(header, username, password, qop, uri, \
-                                                                              body, nc)
-            self.assertEqual(authorized_response.status_code, 200)
-        stale_response, nonce = self._test_digest_response_for_auth_request(header, username, password, qop, uri, \
-                                                                     body, stale_after + 1)
-        self.assertEqual(stale_response.status_code, 401)
-        header = stale_response.headers.get('WWW-Authenticate')
-        self.assertIn('stale=TRUE', header)
-
-    def _test_digest_response_for_auth_request(self, header, username, password, qop, uri, body, nc=1, nonce=None):
-        auth_type, auth_info = header.split(None, 1)
-        self.assertEqual(auth_type, 'Digest')
-
-        d = parse_dict_header(auth_info)
-
-        nonce = nonce or d['nonce']
-        realm = d['realm']
-        opaque = d['opaque']
-        if qop :
-            self.assertIn(qop, [x.strip() for x in d['qop'].split(',')], 'Challenge should contains expected qop')
-        algorithm = d['algorithm']
-
-        cnonce, nc = (_hash(os.urandom(10), "MD5"), '{:08}'.format(nc)) if qop in ('auth', 'auth-int') else (None, None)
-
-        auth_header = _make_digest_auth_header(
-            username, password, 'GET', uri, nonce, realm, opaque, algorithm, qop, cnonce, nc, body)
-
-        # make second request
-        return self.app.get(
-            uri,
-            environ_base={
-                # httpbin's digest auth implementation uses the remote addr to
-                # build the nonce
-                'REMOTE_ADDR': '127.0.0.1',
-            },
-            headers={
-                'Authorization': auth_header,
-            },
-            data=body
-        ), nonce
-
-    def test_digest_auth_wrong_pass(self):
-        """Test different combinations of digest auth parameters"""
-        username = 'user'
-        password = 'passwd'
-        for qop in None, 'auth', 'auth-int',:
-            for algorithm in None, 'MD5', 'SHA-256', 'SHA-512':
-                for body in None, b'', b'request payload':
-                    self._test_digest_auth_wrong_pass(username, password, qop, algorithm, body, 3)
-
-    def _test_digest_auth_wrong_pass(self, username, password, qop, algorithm=None, body=None, stale_after=None):
-        uri = self._digest_auth_create_uri(username, password, qop, algorithm, stale_after)
-        unauthorized_response = self._test_digest_auth_first_challenge(uri)
-
-        header = unauthorized_response.headers.get('WWW-Authenticate')
-
-        wrong_pass_response, nonce = self._test_digest_response_for_auth_request(header, username, "wrongPassword", qop, uri, body)
-        self.assertEqual(wrong_pass_response.status_code, 401)
-        header = wrong_pass_response.headers.get('WWW-Authenticate')
-        self.assertNotIn('stale=TRUE', header)
-
-        reused_nonce_response, nonce =  self._test_digest_response_for_auth_request(header, username, password, qop, uri, \
-                                                                              body, nonce=nonce)
-        self.assertEqual(reused_nonce_response.status_code, 401)
-        header = reused_nonce_response.headers.get('WWW-Authenticate')
-        self.assertIn('stale=TRUE', header)
-
     def test_drip(self):
         response = self.app.get('/drip?numbytes=400&duration=2&delay=1')
         self.assertEqual(response.content_length, 400)
@@ -492,9 +453,10 @@ class HttpbinTestCase(unittest.TestCase):
 
     def test_drip_with_invalid_numbytes(self):
         for bad_num in -1, 0:
-            uri = '/drip?numbytes={0}&duration=2&delay=1'.format(bad_num)
-            response = self.app.get(uri)
-            self.assertEqual(response.status_code, 400)
+            with self.subTest(bad_num=bad_num):
+                uri = '/drip?numbytes={0}&duration=2&delay=1'.format(bad_num)
+                response = self.app.get(uri)
+                self.assertEqual(response.status_code, 400)
 
     def test_drip_with_custom_code(self):
         response = self.app.get('/drip?numbytes=400&duration=2&code=500')
@@ -509,17 +471,7 @@ class HttpbinTestCase(unittest.TestCase):
 
     def test_bytes_with_seed(self):
         response = self.app.get('/bytes/10?seed=0')
-        # The RNG changed in python3, so even though we are
-        # setting the seed, we can't expect the value to be the
-        # same across both interpreters.
-        if six.PY3:
-            self.assertEqual(
-                response.data, b'\xc5\xd7\x14\x84\xf8\xcf\x9b\xf4\xb7o'
-            )
-        else:
-            self.assertEqual(
-                response.data, b'\xd8\xc2kB\x82g\xc8Mz\x95'
-            )
+        self.assertEqual(response.data, _BYTES_SEED0)
 
     def test_stream_bytes(self):
         response = self.app.get('/stream-bytes/1024')
@@ -528,17 +480,7 @@ class HttpbinTestCase(unittest.TestCase):
 
     def test_stream_bytes_with_seed(self):
         response = self.app.get('/stream-bytes/10?seed=0')
-        # The RNG changed in python3, so even though we are
-        # setting the seed, we can't expect the value to be the
-        # same across both interpreters.
-        if six.PY3:
-            self.assertEqual(
-                response.data, b'\xc5\xd7\x14\x84\xf8\xcf\x9b\xf4\xb7o'
-            )
-        else:
-            self.assertEqual(
-                response.data, b'\xd8\xc2kB\x82g\xc8Mz\x95'
-            )
+        self.assertEqual(response.data, _BYTES_SEED0)
 
     def test_delete_endpoint_returns_body(self):
         response = self.app.delete(
@@ -550,18 +492,10 @@ class HttpbinTestCase(unittest.TestCase):
         self.assertEqual(form_data, {'name': 'kevin'})
 
     def test_methods__to_status_endpoint(self):
-        methods = [
-            'GET',
-            'HEAD',
-            'POST',
-            'PUT',
-            'DELETE',
-            'PATCH',
-            'TRACE',
-        ]
-        for m in methods:
-            response = self.app.open(path='/status/418', method=m)
-            self.assertEqual(response.status_code, 418)
+        for m in _STATUS_METHODS:
+            with self.subTest(method=m):
+                response = self.app.open(path='/status/418', method=m)
+                self.assertEqual(response.status_code, 418)
 
     def test_status_endpoint_invalid_code(self):
         response = self.app.get(path='/status/4!9')
@@ -640,14 +574,16 @@ class HttpbinTestCase(unittest.TestCase):
     def test_request_range(self):
         response1 = self.app.get('/range/1234')
         self.assertEqual(response1.status_code, 200)
-        self.assertEqual(response1.headers.get('ETag'), 'range1234')
-        self.assertEqual(response1.headers.get('Content-range'), 'bytes 0-1233/1234')
-        self.assertEqual(response1.headers.get('Accept-ranges'), 'bytes')
+        headers1 = dict(response1.headers)
+        self.assertEqual(headers1.get('ETag'), 'range1234')
+        self.assertEqual(headers1.get('Content-Range'), 'bytes 0-1233/1234')
+        self.assertEqual(headers1.get('Accept-Ranges'), 'bytes')
         self.assertEqual(len(self.get_data(response1)), 1234)
 
         response2 = self.app.get('/range/1234')
         self.assertEqual(response2.status_code, 200)
-        self.assertEqual(response2.headers.get('ETag'), 'range1234')
+        headers2 = dict(response2.headers)
+        self.assertEqual(headers2.get('ETag'), 'range1234')
         self.assertEqual(self.get_data(response1), self.get_data(response2))
 
     def test_request_range_with_parameters(self):
@@ -657,11 +593,12 @@ class HttpbinTestCase(unittest.TestCase):
         )
 
         self.assertEqual(response.status_code, 206)
-        self.assertEqual(response.headers.get('ETag'), 'range100')
-        self.assertEqual(response.headers.get('Content-range'), 'bytes 10-24/100')
-        self.assertEqual(response.headers.get('Accept-ranges'), 'bytes')
-        self.assertEqual(response.headers.get('Content-Length'), '15')
-        self.assertEqual(self.get_data(response), 'klmnopqrstuvwxy'.encode('utf8'))
+        headers = dict(response.headers)
+        self.assertEqual(headers.get('ETag'), 'range100')
+        self.assertEqual(headers.get('Content-Range'), 'bytes 10-24/100')
+        self.assertEqual(headers.get('Accept-Ranges'), 'bytes')
+        self.assertEqual(headers.get('Content-Length'), '15')
+        self.assertEqual(self.get_data(response), _ASCII_LOWERCASE[10:25])
 
     def test_request_range_first_15_bytes(self):
         response = self.app.get(
@@ -670,9 +607,10 @@ class HttpbinTestCase(unittest.TestCase):
         )
 
         self.assertEqual(response.status_code, 206)
-        self.assertEqual(response.headers.get('ETag'), 'range1000')
-        self.assertEqual(self.get_data(response), 'abcdefghijklmnop'.encode('utf8'))
-        self.assertEqual(response.headers.get('Content-range'), 'bytes 0-15/1000')
+        headers = dict(response.headers)
+        self.assertEqual(headers.get('ETag'), 'range1000')
+        self.assertEqual(self.get_data(response), _ASCII_LOWERCASE[0:16])
+        self.assertEqual(headers.get('Content-Range'), 'bytes 0-15/1000')
 
     def test_request_range_open_ended_last_6_bytes(self):
         response = self.app.get(
@@ -681,10 +619,11 @@ class HttpbinTestCase(unittest.TestCase):
         )
 
         self.assertEqual(response.status_code, 206)
-        self.assertEqual(response.headers.get('ETag'), 'range26')
-        self.assertEqual(self.get_data(response), 'uvwxyz'.encode('utf8'))
-        self.assertEqual(response.headers.get('Content-range'), 'bytes 20-25/26')
-        self.assertEqual(response.headers.get('Content-Length'), '6')
+        headers = dict(response.headers)
+        self.assertEqual(headers.get('ETag'), 'range26')
+        self.assertEqual(self.get_data(response), _ASCII_LOWERCASE[20:26])
+        self.assertEqual(headers.get('Content-Range'), 'bytes 20-25/26')
+        self.assertEqual(headers.get('Content-Length'), '6')
 
     def test_request_range_suffix(self):
         response = self.app.get(
@@ -693,10 +632,11 @@ class HttpbinTestCase(unittest.TestCase):
         )
 
         self.assertEqual(response.status_code, 206)
-        self.assertEqual(response.headers.get('ETag'), 'range26')
-        self.assertEqual(self.get_data(response), 'vwxyz'.encode('utf8'))
-        self.assertEqual(response.headers.get('Content-range'), 'bytes 21-25/26')
-        self.assertEqual(response.headers.get('Content-Length'), '5')
+        headers = dict(response.headers)
+        self.assertEqual(headers.get('ETag'), 'range26')
+        self.assertEqual(self.get_data(response), _ASCII_LOWERCASE[21:26])
+        self.assertEqual(headers.get('Content-Range'), 'bytes 21-25/26')
+        self.assertEqual(headers.get('Content-Length'), '5')
 
     def test_request_out_of_bounds(self):
         response = self.app.get(
@@ -812,5 +752,147 @@ class HttpbinTestCase(unittest.TestCase):
         self.assertEqual(parse_multi_value_header('W/"xyzzy", W/"r2d2xxxx", W/"c3piozzzz"'), [ "xyzzy", "r2d2xxxx", "c3piozzzz" ])
         self.assertEqual(parse_multi_value_header('*'), [ "*" ])
 
+
+def _digest_auth_first_challenge(client, uri):
+    unauthorized_response = client.get(uri, environ_base=_LOCAL_ENVIRON)
+    # make sure it returns a 401
+    assert unauthorized_response.status_code == 401
+    return unauthorized_response
+
+
+@functools.lru_cache(maxsize=None)
+def _digest_auth_create_uri(username, password, qop, algorithm, stale_after):
+    uri = '/digest-auth/{0}/{1}/{2}'.format(qop or 'wrong-qop', username, password)
+    if algorithm:
+        uri += '/' + algorithm
+    if stale_after:
+        uri += '/{0}'.format(stale_after)
+    return uri
+
+
+def _parse_digest_challenge(header, qop):
+    auth_type, auth_info = header.split(None, 1)
+    assert auth_type == 'Digest'
+
+    d = parse_dict_header(auth_info)
+    if qop:
+        assert qop in [x.strip() for x in d['qop'].split(',')], 'Challenge should contains expected qop'
+    return d
+
+
+def _digest_response_for_auth_request(client, challenge, username, password, qop, uri, body, nc=1, nonce=None,
+                                      ha1=None):
+    nonce = nonce or challenge['nonce']
+    realm = challenge['realm']
+    opaque = challenge['opaque']
+    algorithm = challenge['algorithm']
+
+    # a client nonce only has to be unique, so skip the urandom syscall
+    cnonce, nc = (_hash(random.getrandbits(80).to_bytes(10, 'big'), "MD5"),
+                  _NC_STRS[nc] if nc < len(_NC_STRS) else f'{nc:08}') \
+        if qop in ('auth', 'auth-int') else (None, None)
+
+    auth_header = _make_digest_auth_header(
+        username, password, 'GET', uri, nonce, realm, opaque, algorithm, qop, cnonce, nc, body, ha1)
+
+    # make second request
+    return client.get(
+        uri,
+        environ_base=_LOCAL_ENVIRON,
+        headers={
+            'Authorization': auth_header,
+        },
+        data=body
+    ), nonce
+
+
+def _digest_auth_stale_after_check(client, challenge, username, password, uri, body, qop, stale_after, ha1=None):
+    for nc in range(2, stale_after + 1):
+        authorized_response, nonce = _digest_response_for_auth_request(client, challenge, username, password, qop, uri,
+                                                                       body, nc, ha1=ha1)
+        assert authorized_response.status_code == 200
+    stale_response, nonce = _digest_response_for_auth_request(client, challenge, username, password, qop, uri,
+                                                              body, stale_after + 1, ha1=ha1)
+    assert stale_response.status_code == 401
+    header = stale_response.headers.get('WWW-Authenticate')
+    assert 'stale=TRUE' in header
+
+
+# The digest auth matrix runs as one pytest case per combination, so
+# failures are reported individually and pytest-xdist can spread them over
+# processes. Digest auth tracks state in cookies, so every case gets its own
+# client. SHA-512 cases are marked slow, so quick runs can deselect them
+# with -m "not slow".
+_DIGEST_ALGORITHMS = [
+    pytest.param(None),
+    pytest.param('MD5'),
+    pytest.param('SHA-256'),
+    pytest.param('SHA-512', marks=pytest.mark.slow),
+]
+
+# built from _DIGEST_ALGORITHMS so both matrices carry the same marks
+_DIGEST_AUTH_CASES = [
+    pytest.param(qop, algorithm.values[0], body, stale_after, marks=algorithm.marks)
+    for qop in (None, 'auth', 'auth-int')
+    for algorithm in _DIGEST_ALGORITHMS
+    for body in (None, b'', b'request payload')
+    for stale_after in ((None, 1, 4) if algorithm.values[0] else (None,))
+]
+
+
+@pytest.mark.parametrize('qop, algorithm, body, stale_after', _DIGEST_AUTH_CASES)
+def test_digest_auth(qop, algorithm, body, stale_after):
+    """Test different combinations of digest auth parameters"""
+    client = httpbin.app.test_client()
+    username, password = 'user', 'passwd'
+    uri = _digest_auth_create_uri(username, password, qop, algorithm, stale_after)
+
+    unauthorized_response = _digest_auth_first_challenge(client, uri)
+
+    header = unauthorized_response.headers.get('WWW-Authenticate')
+
+    # every request below answers this same challenge, so parse it and
+    # compute HA1 from its realm and algorithm only once
+    challenge = _parse_digest_challenge(header, qop)
+    ha1 = _digest_ha1(username, challenge['realm'], password, challenge['algorithm'])
+
+    authorized_response, nonce = _digest_response_for_auth_request(client, challenge, username, password, qop, uri,
+                                                                   body, ha1=ha1)
+    assert authorized_response.status_code == 200
+
+    if None == stale_after :
+        return
+
+    # test stale after scenerio
+    _digest_auth_stale_after_check(client, challenge, username, password, uri, body, qop, stale_after, ha1)
+
+
+@pytest.mark.parametrize('body', [None, b'', b'request payload'])
+@pytest.mark.parametrize('algorithm', _DIGEST_ALGORITHMS)
+@pytest.mark.parametrize('qop', [None, 'auth', 'auth-int'])
+def test_digest_auth_wrong_pass(qop, algorithm, body):
+    """Test different combinations of digest auth parameters"""
+    client = httpbin.app.test_client()
+    username, password = 'user', 'passwd'
+    uri = _digest_auth_create_uri(username, password, qop, algorithm, 3)
+    unauthorized_response = _digest_auth_first_challenge(client, uri)
+
+    header = unauthorized_response.headers.get('WWW-Authenticate')
+
+    challenge = _parse_digest_challenge(header, qop)
+    wrong_pass_response, nonce = _digest_response_for_auth_request(client, challenge, username, "wrongPassword", qop,
+                                                                   uri, body)
+    assert wrong_pass_response.status_code == 401
+    header = wrong_pass_response.headers.get('WWW-Authenticate')
+    assert 'stale=TRUE' not in header
+
+    challenge = _parse_digest_challenge(header, qop)
+    reused_nonce_response, nonce = _digest_response_for_auth_request(client, challenge, username, password, qop, uri,
+                                                                     body, nonce=nonce)
+    assert reused_nonce_response.status_code == 401
+    header = reused_nonce_response.headers.get('WWW-Authenticate')
+    assert 'stale=TRUE' in header
+
+
 if __name__ == '__main__':
-    unittest.main()
+    sys.exit(pytest.main([__file__] + sys.argv[1:]))